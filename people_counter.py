@@ -23,15 +23,45 @@ from __future__ import annotations
 import argparse
 import math
 import os
+import queue
+import shutil
 import subprocess
 import sys
+import threading
 import time
+from collections import deque
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
 from uuid import uuid4
 
 import cv2
 import numpy as np
 import requests
+import torch
+import torch.nn.functional as F
+from requests.adapters import HTTPAdapter
 from ultralytics import YOLO
+from urllib3.util.retry import Retry
+
+try:
+    from numba import njit
+
+    HAVE_NUMBA = True
+except ImportError:  # numba is optional; the kernels below then run as plain Python.
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
+
+try:
+    import ffmpegcv
+except ImportError:  # ffmpegcv is optional; only --decoder nvdec needs it.
+    ffmpegcv = None
 
 # ADJUST RED LINE HERE 
 # Default counting line (pixels). Edit these when changing camera/door setup.
@@ -40,21 +70,50 @@ DEFAULT_LINE_Y1 = 685
 DEFAULT_LINE_X2 = 1020
 DEFAULT_LINE_Y2 = 750
 
+# Minimum time between polls of running uploader subprocesses.
+UPLOAD_REAP_INTERVAL_S = 0.5
+
+# Below roughly 1080p the host<->OpenCL copies cost more than the resize saves.
+UMAT_MIN_PIXELS = 1_920_000
+
 def clamp_int(val: int, lo: int, hi: int) -> int:
     return max(lo, min(hi, int(val)))
 
 
-def side_of_gate(
-    x: float,
-    y: float,
-    x1: int,
-    y1: int,
-    x2: int,
-    y2: int,
-    margin: int,
-) -> int:
+class Gate(NamedTuple):
+    """Counting-gate segment with the per-frame constants of side_of_gate_vec precomputed."""
+
+    x1: int
+    y1: int
+    x2: int
+    y2: int
+    dx: int
+    inv_dx: float
+    dy: int
+    min_x: int
+    max_x: int
+    margin: int
+
+
+def make_gate(x1: int, y1: int, x2: int, y2: int, margin: int) -> Gate:
+    dx = x2 - x1
+    return Gate(
+        x1=x1,
+        y1=y1,
+        x2=x2,
+        y2=y2,
+        dx=dx,
+        inv_dx=1.0 / dx if dx else 0.0,
+        dy=y2 - y1,
+        min_x=min(x1, x2),
+        max_x=max(x1, x2),
+        margin=margin,
+    )
+
+
+def side_of_gate_vec(xs: np.ndarray, ys: np.ndarray, gate: Gate) -> np.ndarray:
     """
-    Return which side of a gate segment a point is on.
+    Return which side of the gate segment each point is on, as int8 codes.
 
     For non-vertical gates, compare y against the gate y-value at point x.
     For vertical gates, fall back to point x against gate x.
@@ -63,25 +122,15 @@ def side_of_gate(
      0: in dead-zone or outside span
     +1: below/right
     """
-    min_x, max_x = min(x1, x2), max(x1, x2)
-    if x < (min_x - margin) or x > (max_x + margin):
-        return 0
-
-    dx = x2 - x1
-    if dx == 0:
-        if x < x1 - margin:
-            return -1
-        if x > x1 + margin:
-            return 1
-        return 0
-
-    t = (x - x1) / float(dx)
-    y_on_gate = y1 + t * (y2 - y1)
-    if y < y_on_gate - margin:
-        return -1
-    if y > y_on_gate + margin:
-        return 1
-    return 0
+    if gate.dx == 0:
+        # Vertical gate: compare x against the gate x.
+        pos, ref = xs, float(gate.x1)
+    else:
+        pos, ref = ys, gate.y1 + (xs - gate.x1) * (gate.inv_dx * gate.dy)
+    sides = (pos > ref + gate.margin).astype(np.int8) - (pos < ref - gate.margin).astype(np.int8)
+    in_span = (xs >= gate.min_x - gate.margin) & (xs <= gate.max_x + gate.margin)
+    sides[~in_span] = 0
+    return sides
 
 
 def side_of_line(
@@ -96,7 +145,7 @@ def side_of_line(
     """
     Return which side of the infinite line a point is on.
 
-    This matches the sign semantics of side_of_gate but does not restrict
+    This matches the sign semantics of side_of_gate_vec but does not restrict
     the point to the segment span (useful for building zones from the line).
 
     -1: above/left
@@ -227,19 +276,11 @@ def extend_line_to_frame(
             clamp_int(y2, 0, h_max),
         )
 
-    best_i, best_j = 0, 1
-    best_d2 = -1.0
-    for i in range(len(points)):
-        for j in range(i + 1, len(points)):
-            ddx = points[i][0] - points[j][0]
-            ddy = points[i][1] - points[j][1]
-            d2 = ddx * ddx + ddy * ddy
-            if d2 > best_d2:
-                best_d2 = d2
-                best_i, best_j = i, j
-
-    ax, ay = points[best_i]
-    bx, by = points[best_j]
+    # A line meets the frame border in at most two distinct points; extra
+    # entries are duplicates where it passes through a corner. The second
+    # endpoint is whichever point lies farthest from the first.
+    ax, ay = points[0]
+    bx, by = max(points[1:], key=lambda p: (p[0] - ax) ** 2 + (p[1] - ay) ** 2)
     return (
         clamp_int(int(round(ax)), 0, w_max),
         clamp_int(int(round(ay)), 0, h_max),
@@ -248,31 +289,310 @@ def extend_line_to_frame(
     )
 
 
+def counting_roi(
+    points: np.ndarray,
+    pad: int,
+    width: int,
+    height: int,
+) -> tuple[int, int, int, int]:
+    """
+    Padded bounding box (x0, y0, x1, y1; end-exclusive) around the counting
+    geometry, clipped to the frame.
+    """
+    pts = np.asarray(points).reshape(-1, 2)
+    x0 = clamp_int(int(pts[:, 0].min()) - pad, 0, max(0, width - 1))
+    y0 = clamp_int(int(pts[:, 1].min()) - pad, 0, max(0, height - 1))
+    x1 = clamp_int(int(pts[:, 0].max()) + pad + 1, x0 + 1, width)
+    y1 = clamp_int(int(pts[:, 1].max()) + pad + 1, y0 + 1, height)
+    return x0, y0, x1, y1
+
+
 def point_in_polygon(poly: np.ndarray, x: float, y: float, margin_px: int = 0) -> bool:
     if margin_px <= 0:
         return cv2.pointPolygonTest(poly, (float(x), float(y)), False) >= 0
     return cv2.pointPolygonTest(poly, (float(x), float(y)), True) >= -float(margin_px)
 
 
-def crossing_direction(prev_side: int, curr_side: int) -> str | None:
-    if prev_side == -1 and curr_side == 1:
-        return "down"
-    if prev_side == 1 and curr_side == -1:
-        return "up"
-    return None
+def polygon_bbox(poly: np.ndarray) -> tuple[int, int, int, int]:
+    pts = poly.reshape(-1, 2)
+    return (
+        int(pts[:, 0].min()),
+        int(pts[:, 1].min()),
+        int(pts[:, 0].max()),
+        int(pts[:, 1].max()),
+    )
+
+
+def convex_quad(poly: np.ndarray) -> tuple[np.ndarray, np.ndarray] | None:
+    """
+    Return the quad's vertex x/y arrays for points_in_quad, or None when the
+    polygon is not a convex quad (e.g. after clamping to the frame), in which
+    case callers should stay on cv2.pointPolygonTest.
+    """
+    pts = poly.reshape(-1, 2).astype(np.float64)
+    if pts.shape[0] != 4:
+        return None
+    edges = np.roll(pts, -1, axis=0) - pts
+    nxt = np.roll(edges, -1, axis=0)
+    turns = edges[:, 0] * nxt[:, 1] - edges[:, 1] * nxt[:, 0]
+    if (turns < 0).any() and (turns > 0).any():
+        return None
+    return np.ascontiguousarray(pts[:, 0]), np.ascontiguousarray(pts[:, 1])
+
+
+def points_in_quad(xs: np.ndarray, ys: np.ndarray, quad: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    """
+    Inclusive point-in-convex-quad test for arrays of points: a point is inside
+    when its (N, 4) edge cross products share a sign (zero counts as either).
+    """
+    qxs, qys = quad
+    ex = np.roll(qxs, -1) - qxs
+    ey = np.roll(qys, -1) - qys
+    cross = ex * (ys[:, None] - qys) - ey * (xs[:, None] - qxs)
+    return ~((cross < 0.0).any(axis=1) & (cross > 0.0).any(axis=1))
+
+
+def points_in_zone(
+    poly: np.ndarray,
+    bbox: tuple[int, int, int, int],
+    xs: np.ndarray,
+    ys: np.ndarray,
+    margin_px: int = 0,
+    quad: tuple[np.ndarray, np.ndarray] | None = None,
+) -> np.ndarray:
+    """
+    point_in_polygon over arrays of points, with a cheap bounding-box rejection
+    first and the quad test instead of OpenCV when there is no margin. Returns
+    a boolean mask.
+    """
+    hit = (
+        (xs >= bbox[0] - margin_px)
+        & (xs <= bbox[2] + margin_px)
+        & (ys >= bbox[1] - margin_px)
+        & (ys <= bbox[3] + margin_px)
+    )
+    if quad is not None and margin_px <= 0:
+        hit[hit] = points_in_quad(xs[hit], ys[hit], quad)
+        return hit
+    # A margin is a Euclidean distance to the polygon, which only OpenCV gives us.
+    for i in np.flatnonzero(hit).tolist():
+        hit[i] = point_in_polygon(poly, xs[i], ys[i], margin_px)
+    return hit
+
+
+@njit(cache=True, fastmath=True)
+def _update_counts_jit(
+    foot_xs: np.ndarray,
+    foot_ys: np.ndarray,
+    prev_sides: np.ndarray,
+    x1: float,
+    y1: float,
+    slope: float,
+    vertical: bool,
+    min_x: float,
+    max_x: float,
+    margin: float,
+    entry_code: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Single-pass compiled form of _update_counts (same arithmetic as side_of_gate_vec)."""
+    n = foot_xs.shape[0]
+    events = np.zeros(n, dtype=np.int8)
+    new_sides = prev_sides.copy()
+    for i in range(n):
+        x = foot_xs[i]
+        if x < min_x - margin or x > max_x + margin:
+            continue
+        if vertical:
+            pos = x
+            ref = x1
+        else:
+            pos = foot_ys[i]
+            ref = y1 + (x - x1) * slope
+        if pos > ref + margin:
+            curr_side = 1
+        elif pos < ref - margin:
+            curr_side = -1
+        else:
+            continue
+        prev_side = prev_sides[i]
+        if prev_side != 0 and prev_side != curr_side:
+            events[i] = 1 if curr_side == entry_code else -1
+        new_sides[i] = curr_side
+    return events, new_sides
+
+
+def _update_counts(
+    foot_xs: np.ndarray,
+    foot_ys: np.ndarray,
+    prev_sides: np.ndarray,
+    gate: Gate,
+    entry_code: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Line-mode counting over all tracked foot points of a frame.
+
+    prev_sides holds each track's last non-zero side (0 = not seen yet). Returns
+    (events, new_sides) where events is +1 for an entry, -1 for an exit and 0
+    otherwise; the caller applies them in detection order.
+    """
+    if HAVE_NUMBA:
+        return _update_counts_jit(
+            foot_xs,
+            foot_ys,
+            prev_sides,
+            float(gate.x1),
+            float(gate.y1),
+            gate.inv_dx * gate.dy,
+            gate.dx == 0,
+            float(gate.min_x),
+            float(gate.max_x),
+            float(gate.margin),
+            entry_code,
+        )
+    curr_sides = side_of_gate_vec(foot_xs, foot_ys, gate)
+    seen = curr_sides != 0
+    # Sides are +/-1, so a change between two seen sides is a crossing in the
+    # direction of the new side (+1 = "down", -1 = "up").
+    crossed = seen & (prev_sides != 0) & (curr_sides != prev_sides)
+    events = np.where(crossed, np.where(curr_sides == entry_code, 1, -1), 0).astype(np.int8)
+    new_sides = np.where(seen, curr_sides, prev_sides)
+    return events, new_sides
+
+
+def fetch_detections(results: Iterable) -> list[tuple[np.ndarray, np.ndarray | None]]:
+    """
+    Pack every result's boxes and track IDs into one host array.
+
+    Results with tracks already hold CPU boxes (the tracker rebuilds them from
+    its NumPy state); results without confirmed tracks keep the model's device
+    boxes, which may be FP16. Each result's (N, 5) rows are therefore brought to
+    the host as float32 before the concatenation. Returns (xyxy, ids) per
+    result, with ids None for results without track IDs.
+    """
+    packed = []
+    counts: list[int] = []
+    tracked: list[bool] = []
+    for result in results:
+        boxes = result.boxes
+        n = 0 if boxes is None else len(boxes)
+        counts.append(n)
+        tracked.append(n > 0 and boxes.id is not None)
+        if n == 0:
+            continue
+        tid = boxes.id if boxes.id is not None else boxes.xyxy.new_zeros(n)
+        rows = torch.cat((boxes.xyxy, tid.unsqueeze(1).to(boxes.xyxy.dtype)), dim=1)
+        packed.append(rows.to("cpu", torch.float32))
+
+    host = torch.cat(packed).numpy() if packed else np.zeros((0, 5), dtype=np.float32)
+    out: list[tuple[np.ndarray, np.ndarray | None]] = []
+    start = 0
+    for n, has_ids in zip(counts, tracked):
+        rows = host[start : start + n]
+        start += n
+        out.append((rows[:, :4], rows[:, 4].astype(np.int64) if has_ids else None))
+    return out
+
+
+def warm_up_kernels() -> None:
+    """Compile (or load from cache) the numba counting kernel before the first frame."""
+    _update_counts(np.zeros(1), np.zeros(1), np.zeros(1, dtype=np.int8), make_gate(0, 0, 1, 1, 0), 1)
+
+
+def ensure_track_capacity(table: np.ndarray, max_slot: int, fill: float = 0) -> np.ndarray:
+    """
+    Grow a per-track state array (indexed by track slot) so that
+    table[max_slot] is valid. Capacity doubles to keep growth amortized O(1);
+    new entries are set to fill, which means "not seen yet".
+    """
+    if max_slot < table.shape[0]:
+        return table
+    grown = np.full(max(table.shape[0] * 2, max_slot + 1), fill, dtype=table.dtype)
+    grown[: table.shape[0]] = table
+    return grown
+
+
+class TrackSlots:
+    """
+    Map tracker IDs, which keep growing over a run, to a compact range of
+    reusable slots indexing the per-track state arrays in main().
+
+    Call tick() once per processed frame. sweep() releases the slots of tracks
+    not seen for ttl_frames processed frames and returns them so the caller can
+    reset their state before they are handed out again.
+    """
+
+    def __init__(self, ttl_frames: int = 300, capacity: int = 256) -> None:
+        self.ttl_frames = ttl_frames
+        self.frame = 0
+        self._slot_of: dict[int, int] = {}
+        self._tid_of = np.full(capacity, -1, dtype=np.int64)
+        self._last_seen = np.zeros(capacity, dtype=np.int64)
+        self._free: list[int] = []
+        self._next = 0
+
+    def tick(self) -> None:
+        self.frame += 1
+
+    def assign(self, ids: np.ndarray) -> np.ndarray:
+        """Slots for this frame's track IDs, allocating new ones as needed."""
+        slots = np.empty(len(ids), dtype=np.int64)
+        for i, tid in enumerate(ids.tolist()):
+            slot = self._slot_of.get(tid)
+            if slot is None:
+                slot = self._free.pop() if self._free else self._allocate()
+                self._slot_of[tid] = slot
+                self._tid_of[slot] = tid
+            slots[i] = slot
+        self._last_seen[slots] = self.frame
+        return slots
+
+    def _allocate(self) -> int:
+        slot = self._next
+        self._next += 1
+        self._tid_of = ensure_track_capacity(self._tid_of, slot, -1)
+        self._last_seen = ensure_track_capacity(self._last_seen, slot)
+        return slot
+
+    def sweep(self) -> np.ndarray:
+        in_use = self._tid_of[: self._next] >= 0
+        stale_mask = in_use & (self._last_seen[: self._next] < self.frame - self.ttl_frames)
+        stale = np.nonzero(stale_mask)[0]
+        for slot in stale.tolist():
+            del self._slot_of[int(self._tid_of[slot])]
+            self._tid_of[slot] = -1
+            self._free.append(slot)
+        return stale
+
+
+def room_risk_session(cv_api_key: str) -> requests.Session:
+    """
+    Keep-alive session with the CV API key set once rather than per request.
+
+    Checks run one at a time on a single worker, so one pooled connection per
+    host is enough. One quick retry covers connect timeouts and refused
+    connections; read errors are never retried (read=0) so a POST the server
+    may already have received is not replayed.
+    """
+    session = requests.Session()
+    session.headers["x-cv-api-key"] = cv_api_key
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=2,
+        max_retries=Retry(total=1, read=0, backoff_factor=0.05),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 def check_room_high_risk(
     session: requests.Session,
-    api_base_url: str,
-    cv_api_key: str,
+    url: str,
     room_id: str,
     timeout_seconds: int,
 ) -> dict:
-    url = f"{api_base_url.rstrip('/')}/api/cv/room-risk"
     response = session.post(
         url,
-        headers={"x-cv-api-key": cv_api_key},
         json={"room_id": room_id},
         timeout=timeout_seconds,
     )
@@ -283,15 +603,30 @@ def check_room_high_risk(
     return payload
 
 
-def current_video_seconds(cap: cv2.VideoCapture, frame_index: int, fps: float) -> float:
-    pos_msec = cap.get(cv2.CAP_PROP_POS_MSEC)
-    if pos_msec and pos_msec > 0:
-        return pos_msec / 1000.0
+def current_video_seconds(frame_index: int, fps: float) -> float:
+    """
+    Timestamp of a frame derived from its index. Querying CAP_PROP_POS_MSEC
+    instead would cost a backend call and, with --batch-size > 1, report the
+    decoder position rather than the frame being processed.
+    """
     if fps > 0:
         return float(frame_index) / float(fps)
     return 0.0
 
 
+def supports_frame_seek(cap: cv2.VideoCapture, probe_frame: int) -> bool:
+    """
+    Check that CAP_PROP_POS_FRAMES seeks land where asked (live streams and
+    some containers misreport it). Rewinds the capture to frame 0 afterwards.
+    """
+    if cap.get(cv2.CAP_PROP_FRAME_COUNT) <= probe_frame:
+        return False
+    ok = cap.set(cv2.CAP_PROP_POS_FRAMES, probe_frame) and cap.grab()
+    landed = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == probe_frame + 1
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    return bool(ok) and landed
+
+
 def launch_uploader_clip(
     uploader_python: str,
     uploader_script: str,
@@ -310,6 +645,9 @@ def launch_uploader_clip(
     env["START_OFFSET_SECONDS"] = f"{max(0.0, start_offset_seconds):.3f}"
     env["MAX_DURATION_SECONDS"] = f"{max(0.1, duration_seconds):.3f}"
     env["VIDEO_ID"] = f"vid_entry_{int(time.time())}_{uuid4().hex[:8]}"
+    # The uploader runs alongside the detector; keep its thread pools small.
+    env.setdefault("OMP_NUM_THREADS", "1")
+    env.setdefault("OPENCV_FOR_THREADS_NUM", "1")
 
     return subprocess.Popen(
         [uploader_python, uploader_script],
@@ -318,22 +656,405 @@ def launch_uploader_clip(
     )
 
 
-def reap_finished_uploads(active_uploads: list[dict[str, object]]) -> None:
-    remaining: list[dict[str, object]] = []
-    for job in active_uploads:
+def reap_finished_uploads(active_uploads: deque[dict[str, object]]) -> None:
+    # Rotate through the jobs once in place: running ones go back on the right.
+    for _ in range(len(active_uploads)):
+        job = active_uploads.popleft()
         proc = job.get("proc")
         trigger = job.get("trigger")
         if not isinstance(proc, subprocess.Popen):
             continue
         rc = proc.poll()
         if rc is None:
-            remaining.append(job)
+            active_uploads.append(job)
             continue
         if rc == 0:
             print(f"[uploader] completed trigger={trigger}")
         else:
             print(f"[uploader] failed trigger={trigger} return_code={rc}")
-    active_uploads[:] = remaining
+
+
+@lru_cache(maxsize=1024)
+def track_label(tid: int) -> str:
+    return f"ID {tid}"
+
+
+def rasterize_text(text: str, scale: float, thickness: int) -> tuple[np.ndarray, int, int]:
+    """
+    Rasterize text with cv2.putText (FONT_HERSHEY_SIMPLEX) onto a tight uint8
+    coverage tile. Returns (coverage, dx, dy): per-pixel coverage in [0, 255]
+    and the tile's top-left offset from the putText origin.
+    """
+    (w, h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+    pad = thickness + 1
+    tile = np.zeros((h + baseline + 2 * pad, w + 2 * pad), dtype=np.uint8)
+    cv2.putText(tile, text, (pad, h + pad), cv2.FONT_HERSHEY_SIMPLEX, scale, 255, thickness)
+    return tile, -pad, -(h + pad)
+
+
+@lru_cache(maxsize=512)
+def text_sprite(text: str, scale: float, thickness: int) -> tuple[np.ndarray, int, int]:
+    """Cached rasterize_text for short, frequently repeated strings (track labels)."""
+    return rasterize_text(text, scale, thickness)
+
+
+def blit_sprite(
+    frame: np.ndarray,
+    sprite: tuple[np.ndarray, int, int],
+    org: tuple[int, int],
+    color: tuple[int, int, int],
+) -> None:
+    """Blend a rasterize_text sprite into frame at the putText origin org."""
+    coverage, dx, dy = sprite
+    x0 = org[0] + dx
+    y0 = org[1] + dy
+    fx0, fy0 = max(0, x0), max(0, y0)
+    fx1 = min(frame.shape[1], x0 + coverage.shape[1])
+    fy1 = min(frame.shape[0], y0 + coverage.shape[0])
+    if fx0 >= fx1 or fy0 >= fy1:
+        return
+    tx0, ty0 = fx0 - x0, fy0 - y0
+    cov = coverage[ty0:ty0 + (fy1 - fy0), tx0:tx0 + (fx1 - fx0)]
+    m = cov > 0
+    a = cov[m].astype(np.float32)[:, None] * (1.0 / 255.0)
+    region = frame[fy0:fy1, fx0:fx1]
+    px = region[m].astype(np.float32)
+    region[m] = (px + (np.asarray(color, dtype=np.float32) - px) * a + 0.5).astype(np.uint8)
+
+
+def blit_text(
+    frame: np.ndarray,
+    text: str,
+    org: tuple[int, int],
+    scale: float,
+    color: tuple[int, int, int],
+    thickness: int,
+) -> None:
+    """Draw text like cv2.putText, blending a cached coverage sprite instead of re-rasterizing."""
+    blit_sprite(frame, text_sprite(text, scale, thickness), org, color)
+
+
+class FfmpegPipeWriter:
+    """
+    Minimal cv2.VideoWriter stand-in that pipes raw BGR frames to an ffmpeg
+    subprocess, for encoders OpenCV's bindings cannot reach (e.g. h264_nvenc
+    on pip builds of OpenCV).
+    """
+
+    def __init__(self, path: str, fps: float, size: tuple[int, int], codec: str) -> None:
+        width, height = size
+        self._proc = subprocess.Popen(
+            [
+                "ffmpeg", "-loglevel", "error", "-y",
+                "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps:.3f}",
+                "-i", "-",
+                "-c:v", codec, "-pix_fmt", "yuv420p",
+                path,
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def isOpened(self) -> bool:
+        return self._proc.poll() is None
+
+    def write(self, frame: np.ndarray) -> None:
+        try:
+            self._proc.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError as err:
+            raise RuntimeError(f"ffmpeg encoder exited (return_code={self._proc.wait()})") from err
+
+    def release(self) -> None:
+        if self._proc.stdin and not self._proc.stdin.closed:
+            try:
+                self._proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        rc = self._proc.wait()
+        if rc != 0:
+            raise RuntimeError(f"ffmpeg encoder failed (return_code={rc})")
+
+
+def ffmpeg_can_encode(codec: str, size: tuple[int, int]) -> bool:
+    """
+    Trial-encode one frame with codec at the size and pixel format
+    FfmpegPipeWriter will use. Builds often list hardware encoders (e.g.
+    h264_nvenc) in -encoders even when no usable device or driver is present,
+    and those encoders also reject some sizes (odd or out-of-range
+    dimensions), so only an actual encode of the real output tells.
+    """
+    if shutil.which("ffmpeg") is None:
+        return False
+    width, height = size
+    try:
+        probe = subprocess.run(
+            [
+                "ffmpeg", "-hide_banner", "-loglevel", "error",
+                "-f", "lavfi", "-i", f"color=c=black:s={width}x{height}",
+                "-frames:v", "1", "-c:v", codec, "-pix_fmt", "yuv420p", "-f", "null", "-",
+            ],
+            capture_output=True,
+            timeout=20,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return probe.returncode == 0
+
+
+def open_video_writer(
+    path: str,
+    fps: float,
+    size: tuple[int, int],
+    encoder: str,
+) -> cv2.VideoWriter | FfmpegPipeWriter:
+    """
+    Open the annotated-output writer.
+
+    "nvenc" asks OpenCV's FFmpeg backend for a hardware-accelerated H.264
+    encoder, then tries piping to an ffmpeg binary with h264_nvenc; "x264"
+    uses OpenCV's software H.264 encoder. Both fall back to mp4v if nothing
+    else is available.
+    """
+    if encoder != "mp4v":
+        params: list[int] = []
+        if encoder == "nvenc":
+            params = [cv2.VIDEOWRITER_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        writer = cv2.VideoWriter(path, cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*"avc1"), fps, size, params)
+        if writer.isOpened():
+            return writer
+        writer.release()
+        if encoder == "nvenc" and ffmpeg_can_encode("h264_nvenc", size):
+            print("[writer] using ffmpeg subprocess with h264_nvenc")
+            return FfmpegPipeWriter(path, fps, size, "h264_nvenc")
+        print(f"[writer] encoder={encoder} unavailable; falling back to mp4v")
+    return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+
+
+class ThreadedWriter:
+    """
+    Encode frames on a background thread so writer.write() does not block the
+    detection loop.
+
+    write() copies the frame into a free slot of a preallocated ring and queues
+    it; it only waits when all slots are still queued for encoding, so no frame
+    is ever dropped. release() drains the queue before releasing the writer.
+    If the underlying writer raises, the error is re-raised on the main thread
+    from the next write() or from release().
+    """
+
+    def __init__(self, writer: cv2.VideoWriter | FfmpegPipeWriter, shape: tuple[int, int, int], slots: int = 4) -> None:
+        self._writer = writer
+        self._ring = np.empty((slots, *shape), dtype=np.uint8)
+        self._free: queue.Queue[int] = queue.Queue()
+        self._filled: queue.Queue[int | None] = queue.Queue()
+        for idx in range(slots):
+            self._free.put(idx)
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self._thread.start()
+
+    def write(self, frame: np.ndarray) -> None:
+        idx = self._free.get()
+        if self._error is not None:
+            raise RuntimeError("video writer failed") from self._error
+        np.copyto(self._ring[idx], frame)
+        self._filled.put(idx)
+
+    def release(self) -> None:
+        self._filled.put(None)
+        self._thread.join()
+        self._writer.release()
+        if self._error is not None:
+            raise RuntimeError("video writer failed") from self._error
+
+    def _run(self) -> None:
+        while True:
+            idx = self._filled.get()
+            if idx is None:
+                break
+            if self._error is None:
+                try:
+                    self._writer.write(self._ring[idx])
+                except Exception as err:  # surfaced on the main thread by write()/release()
+                    self._error = err
+            # Always hand the slot back so write() never blocks on a dead writer.
+            self._free.put(idx)
+
+
+def load_model(
+    model_path: str,
+    quantize: str,
+    calib_data: str,
+    tensorrt: bool = False,
+    batch: int = 1,
+) -> YOLO:
+    """
+    Load the detector, optionally swapping in an accelerated export of .pt weights:
+    a TensorRT FP16 engine on CUDA hosts (tensorrt=True) or an INT8 OpenVINO
+    model on CPU-only hosts (quantize="int8").
+
+    Exports are cached next to the .pt weights and reused on later runs.
+    """
+    if not model_path.endswith(".pt"):
+        return YOLO(model_path)
+
+    weights = Path(model_path)
+    if torch.cuda.is_available():
+        if not tensorrt:
+            return YOLO(model_path)
+        # The export bakes batch in as the engine's max batch, so it is part of the cache key.
+        engine_path = weights.with_name(f"{weights.stem}_b{batch}.engine")
+        if not engine_path.is_file():
+            print(f"[model] exporting TensorRT FP16 engine to {engine_path} (batch={batch})")
+            exported = YOLO(model_path).export(format="engine", half=True, dynamic=True, batch=batch, device=0)
+            Path(exported).replace(engine_path)
+        return YOLO(str(engine_path), task="detect")
+
+    if quantize != "int8":
+        return YOLO(model_path)
+    export_dir = weights.with_name(f"{weights.stem}_int8_openvino_model")
+    if not export_dir.is_dir():
+        print(f"[model] exporting INT8 OpenVINO model to {export_dir} (calibration data={calib_data})")
+        export_dir = Path(YOLO(model_path).export(format="openvino", int8=True, data=calib_data))
+    return YOLO(str(export_dir), task="detect")
+
+
+class GpuResizer:
+    """
+    Resize BGR frames on the GPU instead of with cv2.resize on the CPU.
+
+    Frames are staged through a pinned host buffer so the upload is a single
+    DMA copy; only the (smaller) resized frame comes back to the host.
+    """
+
+    def __init__(self, width: int, height: int, device: str = "cuda:0") -> None:
+        self.size = (int(height), int(width))
+        self.device = torch.device(device)
+        self._pinned: torch.Tensor | None = None
+
+    def __call__(self, frame: np.ndarray) -> np.ndarray:
+        if self._pinned is None or tuple(self._pinned.shape) != frame.shape:
+            self._pinned = torch.empty(frame.shape, dtype=torch.uint8).pin_memory()
+        self._pinned.numpy()[...] = frame
+        src = self._pinned.to(self.device, non_blocking=True)
+        src = src.permute(2, 0, 1).unsqueeze(0).float()
+        out = F.interpolate(src, size=self.size, mode="bilinear", align_corners=False, antialias=True)
+        out = out.round_().clamp_(0, 255).to(torch.uint8).squeeze(0).permute(1, 2, 0)
+        return out.contiguous().cpu().numpy()
+
+
+class NvdecCapture:
+    """
+    cv2.VideoCapture-style grab()/retrieve() over ffmpegcv's NVDEC reader.
+
+    Decoding and the resize to the processing size both run on the GPU, and
+    frames arrive as contiguous BGR arrays.
+    """
+
+    def __init__(self, path: str, size: tuple[int, int]) -> None:
+        self._cap = ffmpegcv.VideoCaptureNV(path, pix_fmt="bgr24", resize=size)
+        self._frame: np.ndarray | None = None
+
+    def grab(self) -> bool:
+        ok, self._frame = self._cap.read()
+        return bool(ok)
+
+    def retrieve(self) -> tuple[bool, np.ndarray | None]:
+        return self._frame is not None, self._frame
+
+    def release(self) -> None:
+        self._cap.release()
+
+
+class DisplayWorker:
+    """
+    Preview window whose --display-scale resize runs on a background thread.
+
+    All HighGUI calls (namedWindow/imshow/waitKey/destroyAllWindows) stay on the
+    calling (main) thread, since HighGUI is not thread-safe and some backends
+    (Cocoa) abort on windows touched from other threads. show() copies the frame
+    into a small preallocated ring and displays the newest frame the thread has
+    finished resizing, so the preview may lag one frame; frames the resize
+    could not keep up with are dropped. Pressing q sets quit_requested.
+    """
+
+    def __init__(
+        self,
+        window: str,
+        shape: tuple[int, int, int],
+        display_scale: float,
+        slots: int = 3,
+        use_umat: bool = False,
+    ) -> None:
+        self.window = window
+        self.use_umat = use_umat
+        self.quit_requested = False
+        cv2.namedWindow(window, cv2.WINDOW_NORMAL)
+        h, w = shape[:2]
+        self._size = (max(1, int(w * display_scale)), max(1, int(h * display_scale)))
+        self._interp = cv2.INTER_AREA if display_scale < 1.0 else cv2.INTER_LINEAR
+        self._thread = None
+        if display_scale == 1.0:
+            return
+        self.ring = np.empty((slots, *shape), dtype=np.uint8)
+        self.scaled = np.empty((slots, self._size[1], self._size[0], shape[2]), dtype=np.uint8)
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._in_latest = -1
+        self._in_reading = -1
+        self._out_latest = -1
+        self._out_showing = -1
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="display", daemon=True)
+        self._thread.start()
+
+    def show(self, frame: np.ndarray) -> None:
+        if self._thread is None:
+            cv2.imshow(self.window, frame)
+        else:
+            with self._lock:
+                # Never overwrite the slot being resized or the one queued next.
+                idx = next(i for i in range(len(self.ring)) if i not in (self._in_latest, self._in_reading))
+            np.copyto(self.ring[idx], frame)
+            with self._lock:
+                self._in_latest = idx
+                out = self._out_showing = self._out_latest
+                self._out_latest = -1
+            self._ready.set()
+            if out >= 0:
+                cv2.imshow(self.window, self.scaled[out])
+                with self._lock:
+                    self._out_showing = -1
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            self.quit_requested = True
+
+    def close(self) -> None:
+        if self._thread is not None:
+            with self._lock:
+                self._closed = True
+            self._ready.set()
+            self._thread.join()
+        cv2.destroyAllWindows()
+
+    def _run(self) -> None:
+        while True:
+            self._ready.wait()
+            with self._lock:
+                self._ready.clear()
+                idx = self._in_reading = self._in_latest
+                self._in_latest = -1
+                out = next(i for i in range(len(self.scaled)) if i not in (self._out_latest, self._out_showing))
+                closed = self._closed
+            if idx >= 0:
+                if self.use_umat:
+                    scaled = cv2.resize(cv2.UMat(self.ring[idx]), self._size, interpolation=self._interp)
+                    np.copyto(self.scaled[out], scaled.get())
+                else:
+                    cv2.resize(self.ring[idx], self._size, dst=self.scaled[out], interpolation=self._interp)
+                with self._lock:
+                    self._in_reading = -1
+                    self._out_latest = out
+            if closed:
+                break
 
 
 def parse_args() -> argparse.Namespace:
@@ -344,6 +1065,28 @@ def parse_args() -> argparse.Namespace:
         default="yolov8n.pt",
         help="Ultralytics model path/name (default: yolov8n.pt)",
     )
+    parser.add_argument(
+        "--tensorrt",
+        action="store_true",
+        help=(
+            "On CUDA hosts, export the .pt model to a TensorRT FP16 engine once (cached next "
+            "to the weights as .engine) and run that instead."
+        ),
+    )
+    parser.add_argument(
+        "--quantize",
+        choices=("none", "int8"),
+        default="none",
+        help=(
+            "int8: on CPU-only hosts, export the .pt model to INT8 OpenVINO once (cached next "
+            "to the weights) and run that instead. Ignored when CUDA is available."
+        ),
+    )
+    parser.add_argument(
+        "--quantize-data",
+        default="coco128.yaml",
+        help="Dataset YAML used to calibrate --quantize int8 (default: coco128.yaml)",
+    )
     parser.add_argument(
         "--tracker",
         default="bytetrack.yaml",
@@ -457,6 +1200,15 @@ def parse_args() -> argparse.Namespace:
             "using --count-mode zone."
         ),
     )
+    parser.add_argument(
+        "--roi-pad",
+        type=int,
+        default=None,
+        help=(
+            "If set, run detection only on the box around the counting line/zones padded by "
+            "this many pixels (before --process-scale). People far from the door are ignored."
+        ),
+    )
     parser.add_argument(
         "--line-margin",
         type=int,
@@ -469,6 +1221,25 @@ def parse_args() -> argparse.Namespace:
         default=4,
         help="Thickness of the drawn counting line",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help=(
+            "Number of frames submitted to the detector per call (default: 1). Larger "
+            "batches improve GPU utilization at the cost of per-frame latency."
+        ),
+    )
+    parser.add_argument(
+        "--cv-threads",
+        type=int,
+        default=2,
+        help=(
+            "OpenCV worker threads (default: 2). A small pool keeps resize/draw "
+            "calls from competing with the tracking loop for cores; 0 disables "
+            "OpenCV threading."
+        ),
+    )
     parser.add_argument(
         "--process-scale",
         type=float,
@@ -478,20 +1249,54 @@ def parse_args() -> argparse.Namespace:
             "This speeds things up but changes pixel coordinates and saved output size."
         ),
     )
+    parser.add_argument(
+        "--gpu-preprocess",
+        action="store_true",
+        help=(
+            "Run the --process-scale resize on the GPU (requires CUDA). "
+            "Falls back to cv2.resize when CUDA is unavailable."
+        ),
+    )
+    parser.add_argument(
+        "--use-umat",
+        action="store_true",
+        help=(
+            "Run cv2 resizes through OpenCL (cv2.UMat) for frames of at least "
+            f"{UMAT_MIN_PIXELS} pixels. Ignored when OpenCV has no OpenCL device."
+        ),
+    )
     parser.add_argument(
         "--stride",
         type=int,
-        default=1.5,
+        default=1,
         help=(
             "Process every Nth frame (default: 1). Higher values run faster but can miss crossings."
         ),
     )
+    parser.add_argument(
+        "--stride-seek",
+        action="store_true",
+        help=(
+            "Skip the frames between strided frames with one seek instead of grab()bing "
+            "each of them. Worth it for large --stride on seekable files; falls back to "
+            "grab() when the source does not report seek positions correctly."
+        ),
+    )
     parser.add_argument(
         "--initial-occupancy",
         type=int,
         default=0,
         help="Starting number of people already in the room",
     )
+    parser.add_argument(
+        "--display-every",
+        type=int,
+        default=1,
+        help=(
+            "With --show, update the preview every Nth processed frame (default: 1). "
+            "Frames that are neither previewed nor saved are not annotated."
+        ),
+    )
     parser.add_argument(
         "--display-scale",
         type=float,
@@ -510,6 +1315,24 @@ def parse_args() -> argparse.Namespace:
         "--save",
         help="Optional output path for annotated video (e.g. out.mp4)",
     )
+    parser.add_argument(
+        "--encoder",
+        choices=("mp4v", "nvenc", "x264"),
+        default="mp4v",
+        help=(
+            "Encoder for --save (default: mp4v). nvenc uses hardware H.264 encoding via "
+            "OpenCV's FFmpeg backend when available."
+        ),
+    )
+    parser.add_argument(
+        "--decoder",
+        choices=("cv2", "nvdec"),
+        default="cv2",
+        help=(
+            "Video decoder (default: cv2). nvdec decodes and resizes on an NVIDIA GPU "
+            "via ffmpegcv (optional dependency)."
+        ),
+    )
     parser.add_argument(
         "--room-id",
         default=os.getenv("ROOM_ID", "").strip(),
@@ -576,14 +1399,35 @@ def main() -> None:
         raise ValueError("--upload-duration-seconds must be > 0")
     if int(args.max_upload_triggers) < 0:
         raise ValueError("--max-upload-triggers must be >= 0")
+    if int(args.cv_threads) < 0:
+        raise ValueError("--cv-threads must be >= 0")
+
+    cv2.setUseOptimized(True)
+    cv2.setNumThreads(int(args.cv_threads))
+    print(
+        f"[opencv] optimized={cv2.useOptimized()} threads={cv2.getNumThreads()} "
+        f"cpu_features={cv2.getCPUFeaturesLine()}"
+    )
 
-    model = YOLO(args.model)
-    api_base_url = args.next_api_base_url.rstrip("/")
-    session = requests.Session()
+    model = load_model(
+        args.model,
+        args.quantize,
+        args.quantize_data,
+        tensorrt=bool(args.tensorrt),
+        batch=max(1, int(args.batch_size)),
+    )
+    # FP16 inference on CUDA; Ultralytics ignores half on CPU backends.
+    half = torch.cuda.is_available()
+    warm_up_kernels()
+    risk_url = f"{args.next_api_base_url.rstrip('/')}/api/cv/room-risk"
+    session = room_risk_session(args.cv_api_key)
 
     cap = cv2.VideoCapture(args.video)
     if not cap.isOpened():
         raise RuntimeError(f"Cannot open video: {args.video}")
+    # Keep at most one queued frame for live sources (webcam/RTSP) so we never
+    # process stale buffered frames; file sources ignore this.
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
 
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
@@ -601,15 +1445,63 @@ def main() -> None:
     foot_ema_alpha = float(args.foot_ema_alpha)
     if not (0.0 < foot_ema_alpha <= 1.0):
         raise ValueError("--foot-ema-alpha must be in (0, 1]")
+    one_minus_alpha = 1.0 - foot_ema_alpha
+    initial_occupancy = int(args.initial_occupancy)
 
     stride = int(args.stride)
     if stride < 1:
         raise ValueError("--stride must be >= 1")
 
+    batch_size = int(args.batch_size)
+    if batch_size < 1:
+        raise ValueError("--batch-size must be >= 1")
+
+    display_every = int(args.display_every)
+    if display_every < 1:
+        raise ValueError("--display-every must be >= 1")
+
     proc_width = max(1, int(width * process_scale))
     proc_height = max(1, int(height * process_scale))
+
+    stride_seek = False
+    if args.stride_seek and stride > 1:
+        stride_seek = args.decoder == "cv2" and supports_frame_seek(cap, stride)
+        if not stride_seek:
+            print("[capture] source does not seek reliably; --stride-seek falls back to grab()")
+
+    resize_on_read = process_scale != 1.0
+    if args.decoder == "nvdec":
+        if ffmpegcv is None:
+            raise RuntimeError("--decoder nvdec requires ffmpegcv (pip install ffmpegcv)")
+        # The cv2 capture above only probed the stream's size and rate.
+        cap.release()
+        cap = NvdecCapture(args.video, (proc_width, proc_height))
+        resize_on_read = False
+
+    gpu_resizer = None
+    if args.gpu_preprocess and resize_on_read:
+        if torch.cuda.is_available():
+            gpu_resizer = GpuResizer(proc_width, proc_height)
+        else:
+            print("[preprocess] CUDA unavailable; --gpu-preprocess falls back to cv2.resize")
+
+    use_umat = False
+    if args.use_umat:
+        if cv2.ocl.haveOpenCL():
+            cv2.ocl.setUseOpenCL(True)
+            use_umat = True
+        else:
+            print("[preprocess] OpenCL unavailable; --use-umat falls back to cv2.resize")
+    umat_read = use_umat and resize_on_read and width * height >= UMAT_MIN_PIXELS
+
+    display = None
     if args.show:
-        cv2.namedWindow("People Detector", cv2.WINDOW_NORMAL)
+        display = DisplayWorker(
+            "People Detector",
+            (proc_height, proc_width, 3),
+            display_scale,
+            use_umat=use_umat and proc_width * proc_height >= UMAT_MIN_PIXELS,
+        )
 
     line_args = (args.line_x1, args.line_y1, args.line_x2, args.line_y2)
     any_line = any(v is not None for v in line_args)
@@ -652,6 +1544,11 @@ def main() -> None:
 
     inside_zone = None
     outside_zone = None
+    inside_bbox = (0, 0, 0, 0)
+    outside_bbox = (0, 0, 0, 0)
+    inside_quad = None
+    outside_quad = None
+    zones_bbox = (0, 0, 0, 0)
     zone_margin_px = 0
     if args.count_mode == "zone":
         zone_depth = int(args.zone_depth)
@@ -687,290 +1584,394 @@ def main() -> None:
             proc_width,
             proc_height,
         )
+        inside_bbox = polygon_bbox(inside_zone)
+        outside_bbox = polygon_bbox(outside_zone)
+        inside_quad = convex_quad(inside_zone)
+        outside_quad = convex_quad(outside_zone)
+        zones_bbox = (
+            min(inside_bbox[0], outside_bbox[0]) - zone_margin_px,
+            min(inside_bbox[1], outside_bbox[1]) - zone_margin_px,
+            max(inside_bbox[2], outside_bbox[2]) + zone_margin_px,
+            max(inside_bbox[3], outside_bbox[3]) + zone_margin_px,
+        )
+
+    # The zones never move, so rasterize them once and copy only their pixels
+    # onto each frame instead of re-running cv2.polylines.
+    overlay_idx = None
+    overlay_px = None
+    if inside_zone is not None and outside_zone is not None:
+        static_overlay = np.zeros((proc_height, proc_width, 3), dtype=np.uint8)
+        # Inside=yellow, Outside=green
+        cv2.polylines(static_overlay, [outside_zone], True, (0, 200, 0), 2)
+        cv2.polylines(static_overlay, [inside_zone], True, (0, 200, 200), 2)
+        overlay_idx = np.nonzero(static_overlay.any(axis=2))
+        overlay_px = static_overlay[overlay_idx]
+        # Only the line pixels are kept; drop the full-frame template.
+        del static_overlay
+
+    roi = None
+    if args.roi_pad is not None:
+        if int(args.roi_pad) < 0:
+            raise ValueError("--roi-pad must be >= 0")
+        if inside_zone is not None and outside_zone is not None:
+            roi_points = np.concatenate([inside_zone, outside_zone])
+        else:
+            roi_points = np.array([[lx1, ly1], [lx2, ly2]], dtype=np.int32)
+        roi_pad_px = int(int(args.roi_pad) * process_scale)
+        roi = counting_roi(roi_points, roi_pad_px, proc_width, proc_height)
+        if roi == (0, 0, proc_width, proc_height):
+            roi = None
 
     writer = None
     if args.save:
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
         out_fps = fps / float(stride)
-        writer = cv2.VideoWriter(args.save, fourcc, out_fps, (proc_width, proc_height))
+        writer = ThreadedWriter(
+            open_video_writer(args.save, out_fps, (proc_width, proc_height), args.encoder),
+            (proc_height, proc_width, 3),
+        )
+
+    # Warm up the detector and tracker on blank frames of the real input shape
+    # so model/cuDNN/TensorRT setup does not stall the first real frame.
+    if roi is not None:
+        warm_shape = (roi[3] - roi[1], roi[2] - roi[0], 3)
+    else:
+        warm_shape = (proc_height, proc_width, 3)
+    warm_frame = np.zeros(warm_shape, dtype=np.uint8)
+    for _ in range(2):
+        model.track(
+            source=[warm_frame] * batch_size,
+            conf=args.conf,
+            classes=[0],
+            persist=True,
+            tracker=args.tracker,
+            half=half,
+            verbose=False,
+        )
+    del warm_frame
+    # The warm-up advanced the persistent trackers' frame counters; ByteTrack only
+    # confirms new tracks immediately on frame 1, so start them from scratch.
+    for tracker in getattr(model.predictor, "trackers", None) or []:
+        tracker.reset()
+
+    # Annotations are only consumed by the preview window and the saved video.
+    render = bool(args.show) or writer is not None
+    render_always = writer is not None or display_every == 1
+
+    entry_code = 1 if args.direction == "down" else -1
+    gate = make_gate(lx1, ly1, lx2, ly2, int(args.line_margin))
 
     frame_index = 0
-    last_side_by_id: dict[int, int] = {}
-    last_zone_by_id: dict[int, int] = {}
-    smooth_foot_by_id: dict[int, tuple[float, float]] = {}
+    # Per-track state, indexed by TrackSlots slot.
+    # Last non-zero side/zone; 0 = not seen yet.
+    track_slots = TrackSlots()
+    last_side_by_slot = np.zeros(256, dtype=np.int8)
+    last_zone_by_slot = np.zeros(256, dtype=np.int8)
+    # Smoothed foot point; NaN = not seen yet.
+    smooth_x_by_slot = np.full(256, np.nan)
+    smooth_y_by_slot = np.full(256, np.nan)
     entered = 0
     left = 0
     uploads_started = 0
     next_upload_left_threshold = 2
-    active_uploads: list[dict[str, object]] = []
-
-    while True:
-        ok, frame = cap.read()
-        if not ok:
-            break
-
-        if process_scale != 1.0:
-            interp = cv2.INTER_AREA if process_scale < 1.0 else cv2.INTER_LINEAR
-            frame = cv2.resize(frame, (proc_width, proc_height), interpolation=interp)
+    active_uploads: deque[dict[str, object]] = deque()
+
+    # Room-risk lookups run on a worker thread so an entry never stalls the
+    # frame loop on HTTP. A single worker keeps the shared requests.Session
+    # single-threaded; results are handled back on this thread in entry order.
+    risk_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="room-risk")
+    pending_risk: deque[tuple[Future, int, int]] = deque()
+
+    def submit_risk_check(entry_frame: int) -> None:
+        # The threshold and upload count only grow, so an entry that cannot
+        # trigger an upload now never will; skip its HTTP round trip.
+        if left < next_upload_left_threshold or uploads_started >= int(args.max_upload_triggers):
+            return
+        future = risk_pool.submit(
+            check_room_high_risk,
+            session=session,
+            url=risk_url,
+            room_id=args.room_id,
+            timeout_seconds=int(args.risk_timeout_seconds),
+        )
+        pending_risk.append((future, entry_frame, left))
+
+    def handle_risk_results(block: bool = False) -> None:
+        nonlocal uploads_started, next_upload_left_threshold
+        while pending_risk and (block or pending_risk[0][0].done()):
+            future, entry_frame, left_at_entry = pending_risk.popleft()
+            try:
+                risk = future.result()
+                print(
+                    "[room-risk] "
+                    f"room_id={risk.get('room_id', args.room_id)} "
+                    f"score={risk.get('risk_score')} "
+                    f"threshold={risk.get('risk_threshold')} "
+                    f"is_high_risk={risk.get('is_high_risk')}",
+                )
+                if (
+                    bool(risk.get("is_high_risk"))
+                    and left_at_entry >= next_upload_left_threshold
+                    and uploads_started < int(args.max_upload_triggers)
+                ):
+                    entry_sec = current_video_seconds(entry_frame, fps)
+                    clip_duration = max(float(args.upload_duration_seconds), float(entry_sec))
+                    print(
+                        "[uploader] launching "
+                        f"entry_sec={entry_sec:.2f} "
+                        f"start_sec=0.00 "
+                        f"duration={clip_duration:.2f}s",
+                    )
+                    rc = launch_uploader_clip(
+                        uploader_python=str(args.uploader_python),
+                        uploader_script=str(args.uploader_script),
+                        source_video=str(args.video),
+                        room_id=str(args.room_id),
+                        cv_api_key=str(args.cv_api_key),
+                        next_api_base_url=str(args.next_api_base_url),
+                        start_offset_seconds=0.0,
+                        duration_seconds=clip_duration,
+                    )
+                    uploads_started += 1
+                    next_upload_left_threshold += 2
+                    active_uploads.append({"trigger": uploads_started, "proc": rc})
+                    print(
+                        f"[uploader] started trigger={uploads_started} "
+                        f"pid={rc.pid}"
+                    )
+            except (requests.RequestException, ValueError, RuntimeError, OSError) as err:
+                print(f"[room-risk] failed room_id={args.room_id}: {err}")
+
+    def read_batches():
+        """Yield (frames, frame_numbers) batches of decoded, resized frames."""
+        nonlocal frame_index
+        # Frames jumped over by the last stride seek. They are only counted once
+        # the grab() after the seek succeeds, so a seek past the end of the file
+        # does not inflate frame_index.
+        seek_skipped = 0
+        while True:
+            frames: list[np.ndarray] = []
+            frame_numbers: list[int] = []
+            while len(frames) < batch_size:
+                # Skipped frames below are only grab()bed; retrieve() decodes the kept one.
+                if not cap.grab():
+                    break
+                frame_index += seek_skipped
+                seek_skipped = 0
+                ok, frame = cap.retrieve()
+                if not ok:
+                    break
 
-        if inside_zone is not None and outside_zone is not None:
-            # Inside=yellow, Outside=green
-            cv2.polylines(frame, [outside_zone], True, (0, 200, 0), 2)
-            cv2.polylines(frame, [inside_zone], True, (0, 200, 200), 2)
+                if gpu_resizer is not None:
+                    frame = gpu_resizer(frame)
+                elif umat_read:
+                    frame = cv2.resize(
+                        cv2.UMat(frame), (proc_width, proc_height), interpolation=cv2.INTER_LINEAR
+                    ).get()
+                elif resize_on_read:
+                    # INTER_LINEAR is several times cheaper than INTER_AREA and is
+                    # plenty for detector input; YOLO letterboxes the frame again anyway.
+                    frame = cv2.resize(frame, (proc_width, proc_height), interpolation=cv2.INTER_LINEAR)
+
+                frames.append(frame)
+                frame_numbers.append(frame_index)
+                frame_index += 1
 
+                if stride_seek:
+                    seek_skipped = stride - 1
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index + seek_skipped)
+                elif stride > 1:
+                    for _ in range(stride - 1):
+                        if not cap.grab():
+                            break
+                        frame_index += 1
+
+            if not frames:
+                return
+            yield frames, frame_numbers
+
+    next_reap_at = 0.0
+    last_hud_key = None
+    hud_sprite = None
+    stop = False
+    for frames, frame_numbers in read_batches():
+        sources = frames
+        if roi is not None:
+            sources = [f[roi[1] : roi[3], roi[0] : roi[2]] for f in frames]
+
+        # One call per batch: the tracker still updates frame-by-frame in order.
+        # stream=True hands back a generator so results are not collected into
+        # a list before fetch_detections walks them.
         results = model.track(
-            source=frame,
+            source=sources,
             conf=args.conf,
             classes=[0],  # class 0 = person in COCO
             persist=True,
             tracker=args.tracker,
+            half=half,
             verbose=False,
+            stream=True,
         )
 
-        result = results[0]
-        boxes = result.boxes
-
-        people_in_frame = 0
-        if boxes is not None and len(boxes) > 0:
-            xyxy = boxes.xyxy.cpu().tolist()
-            ids = None
-            if boxes.id is not None:
-                ids = boxes.id.int().cpu().tolist()
-
-            people_in_frame = len(xyxy)
-            for idx, (x1, y1, x2, y2) in enumerate(xyxy):
-                tid = None if ids is None else ids[idx]
-                tid_i = None if tid is None else int(tid)
-
-                foot_x = (x1 + x2) / 2.0
-                foot_y = y2
+        detections = fetch_detections(results)
+        for frame, frame_number, (xyxy, ids) in zip(frames, frame_numbers, detections):
+            show_now = display is not None and (frame_number // stride) % display_every == 0
+            draw = render and (render_always or show_now)
+            if draw and overlay_idx is not None:
+                frame[overlay_idx] = overlay_px
+
+            track_slots.tick()
+            if track_slots.frame % 64 == 0:
+                stale = track_slots.sweep()
+                last_side_by_slot[stale] = 0
+                last_zone_by_slot[stale] = 0
+                smooth_x_by_slot[stale] = np.nan
+                smooth_y_by_slot[stale] = np.nan
+
+            people_in_frame = 0
+            if len(xyxy) > 0:
+                if roi is not None:
+                    # Map crop coordinates back to the full frame.
+                    xyxy += (roi[0], roi[1], roi[0], roi[1])
+
+                people_in_frame = len(xyxy)
+                foot_x = (xyxy[:, 0].astype(np.float64) + xyxy[:, 2]) * 0.5
+                foot_y = xyxy[:, 3].astype(np.float64)
+
+                slots = None
+                if ids is not None:
+                    slots = track_slots.assign(ids)
+                    max_slot = int(slots.max())
+                    last_side_by_slot = ensure_track_capacity(last_side_by_slot, max_slot)
+                    last_zone_by_slot = ensure_track_capacity(last_zone_by_slot, max_slot)
+                    smooth_x_by_slot = ensure_track_capacity(smooth_x_by_slot, max_slot, np.nan)
+                    smooth_y_by_slot = ensure_track_capacity(smooth_y_by_slot, max_slot, np.nan)
 
                 # Optional smoothing/clamping to reduce jittery "foot" motion caused by
-                # bounding-box fluctuations.
-                if tid_i is not None and (foot_max_dy_px > 0 or foot_ema_alpha < 1.0):
-                    prev = smooth_foot_by_id.get(tid_i)
-                    if prev is None:
-                        smooth_foot_by_id[tid_i] = (foot_x, foot_y)
-                    else:
-                        prev_x, prev_y = prev
+                # bounding-box fluctuations. Vectorized over all tracked detections.
+                if slots is not None and (foot_max_dy_px > 0 or foot_ema_alpha < 1.0):
+                    prev_x = smooth_x_by_slot[slots]
+                    prev_y = smooth_y_by_slot[slots]
+                    seen = ~np.isnan(prev_x)
+                    if seen.any():
                         raw_x, raw_y = foot_x, foot_y
-
                         if foot_max_dy_px > 0:
-                            dy = raw_y - prev_y
-                            if dy > float(foot_max_dy_px):
-                                raw_y = prev_y + float(foot_max_dy_px)
-                            elif dy < -float(foot_max_dy_px):
-                                raw_y = prev_y - float(foot_max_dy_px)
-
+                            raw_y = np.clip(raw_y, prev_y - foot_max_dy_px, prev_y + foot_max_dy_px)
                         if foot_ema_alpha < 1.0:
-                            a = foot_ema_alpha
-                            foot_x = a * raw_x + (1.0 - a) * prev_x
-                            foot_y = a * raw_y + (1.0 - a) * prev_y
+                            raw_x = foot_ema_alpha * raw_x + one_minus_alpha * prev_x
+                            raw_y = foot_ema_alpha * raw_y + one_minus_alpha * prev_y
+                        foot_x = np.where(seen, raw_x, foot_x)
+                        foot_y = np.where(seen, raw_y, foot_y)
+                    smooth_x_by_slot[slots] = foot_x
+                    smooth_y_by_slot[slots] = foot_y
+
+                if draw:
+                    for cx, cy in zip(foot_x.astype(np.int32).tolist(), foot_y.astype(np.int32).tolist()):
+                        cv2.circle(frame, (cx, cy), 4, (0, 255, 255), -1)
+
+                # Update counts only when we have stable track IDs.
+                if slots is not None and inside_zone is not None and outside_zone is not None:
+                    # Feet outside both zones' (margin-expanded) boxes can only give
+                    # curr_zone == 0, so drop them before the zone tests.
+                    near = (
+                        (foot_x >= zones_bbox[0])
+                        & (foot_x <= zones_bbox[2])
+                        & (foot_y >= zones_bbox[1])
+                        & (foot_y <= zones_bbox[3])
+                    )
+                    near_x = foot_x[near]
+                    near_y = foot_y[near]
+                    in_inside = points_in_zone(inside_zone, inside_bbox, near_x, near_y, zone_margin_px, inside_quad)
+                    in_outside = points_in_zone(outside_zone, outside_bbox, near_x, near_y, zone_margin_px, outside_quad)
+                    curr_zones = in_inside.astype(np.int8) - in_outside.astype(np.int8)
+
+                    zoned = curr_zones != 0
+                    zone_slots = slots[near][zoned]
+                    curr_zones = curr_zones[zoned]
+                    prev_zones = last_zone_by_slot[zone_slots]
+                    last_zone_by_slot[zone_slots] = curr_zones
+                    # Zones are +/-1, so a change between two seen zones is an
+                    # entry (outside -> inside) or an exit; curr_zones gives which.
+                    zone_events = curr_zones[(prev_zones != 0) & (prev_zones != curr_zones)]
+                    for event in zone_events.tolist():
+                        if event > 0:
+                            entered += 1
+                            submit_risk_check(frame_number)
                         else:
-                            foot_x, foot_y = raw_x, raw_y
-
-                        smooth_foot_by_id[tid_i] = (foot_x, foot_y)
-                cv2.circle(frame, (int(foot_x), int(foot_y)), 4, (0, 255, 255), -1)
-
-                # Update counts only when we have a stable track ID.
-                if tid_i is not None:
-                    if args.count_mode == "zone" and inside_zone is not None and outside_zone is not None:
-                        in_inside = point_in_polygon(inside_zone, foot_x, foot_y, zone_margin_px)
-                        in_outside = point_in_polygon(outside_zone, foot_x, foot_y, zone_margin_px)
-
-                        curr_zone = 0
-                        if in_inside and not in_outside:
-                            curr_zone = 1
-                        elif in_outside and not in_inside:
-                            curr_zone = -1
-
-                        if curr_zone != 0:
-                            prev_zone = last_zone_by_id.get(tid_i)
-                            if prev_zone == -1 and curr_zone == 1:
-                                entered += 1
-                                try:
-                                    risk = check_room_high_risk(
-                                        session=session,
-                                        api_base_url=api_base_url,
-                                        cv_api_key=args.cv_api_key,
-                                        room_id=args.room_id,
-                                        timeout_seconds=int(args.risk_timeout_seconds),
-                                    )
-                                    print(
-                                        "[room-risk] "
-                                        f"room_id={risk.get('room_id', args.room_id)} "
-                                        f"score={risk.get('risk_score')} "
-                                        f"threshold={risk.get('risk_threshold')} "
-                                        f"is_high_risk={risk.get('is_high_risk')}",
-                                    )
-                                    if (
-                                        bool(risk.get("is_high_risk"))
-                                        and left >= next_upload_left_threshold
-                                        and uploads_started < int(args.max_upload_triggers)
-                                    ):
-                                        entry_sec = current_video_seconds(cap, frame_index, fps)
-                                        clip_duration = max(float(args.upload_duration_seconds), float(entry_sec))
-                                        print(
-                                            "[uploader] launching "
-                                            f"entry_sec={entry_sec:.2f} "
-                                            f"start_sec=0.00 "
-                                            f"duration={clip_duration:.2f}s",
-                                        )
-                                        rc = launch_uploader_clip(
-                                            uploader_python=str(args.uploader_python),
-                                            uploader_script=str(args.uploader_script),
-                                            source_video=str(args.video),
-                                            room_id=str(args.room_id),
-                                            cv_api_key=str(args.cv_api_key),
-                                            next_api_base_url=str(args.next_api_base_url),
-                                            start_offset_seconds=0.0,
-                                            duration_seconds=clip_duration,
-                                        )
-                                        uploads_started += 1
-                                        next_upload_left_threshold += 2
-                                        active_uploads.append({"trigger": uploads_started, "proc": rc})
-                                        print(
-                                            f"[uploader] started trigger={uploads_started} "
-                                            f"pid={rc.pid}"
-                                        )
-                                except (requests.RequestException, ValueError, RuntimeError, OSError) as err:
-                                    print(f"[room-risk] failed room_id={args.room_id}: {err}")
-                            elif prev_zone == 1 and curr_zone == -1:
-                                left += 1
-                            last_zone_by_id[tid_i] = curr_zone
-                    else:
-                        curr_side = side_of_gate(
-                            foot_x,
-                            foot_y,
-                            lx1,
-                            ly1,
-                            lx2,
-                            ly2,
-                            int(args.line_margin),
-                        )
-                        prev_side = last_side_by_id.get(tid_i)
-
-                        if prev_side is None:
-                            if curr_side != 0:
-                                last_side_by_id[tid_i] = curr_side
+                            left += 1
+                elif slots is not None:
+                    events, new_sides = _update_counts(
+                        foot_x,
+                        foot_y,
+                        last_side_by_slot[slots],
+                        gate,
+                        entry_code,
+                    )
+                    last_side_by_slot[slots] = new_sides
+                    # Most frames have no crossings; only those reach the Python branch.
+                    for event in events[events != 0].tolist():
+                        if event > 0:
+                            entered += 1
+                            submit_risk_check(frame_number)
                         else:
-                            if curr_side != 0 and curr_side != prev_side:
-                                direction = crossing_direction(prev_side, curr_side)
-                                if direction == args.direction:
-                                    entered += 1
-                                    try:
-                                        risk = check_room_high_risk(
-                                            session=session,
-                                            api_base_url=api_base_url,
-                                            cv_api_key=args.cv_api_key,
-                                            room_id=args.room_id,
-                                            timeout_seconds=int(args.risk_timeout_seconds),
-                                        )
-                                        print(
-                                            "[room-risk] "
-                                            f"room_id={risk.get('room_id', args.room_id)} "
-                                            f"score={risk.get('risk_score')} "
-                                            f"threshold={risk.get('risk_threshold')} "
-                                            f"is_high_risk={risk.get('is_high_risk')}",
-                                        )
-                                        if (
-                                            bool(risk.get("is_high_risk"))
-                                            and left >= next_upload_left_threshold
-                                            and uploads_started < int(args.max_upload_triggers)
-                                        ):
-                                            entry_sec = current_video_seconds(cap, frame_index, fps)
-                                            clip_duration = max(float(args.upload_duration_seconds), float(entry_sec))
-                                            print(
-                                                "[uploader] launching "
-                                                f"entry_sec={entry_sec:.2f} "
-                                                f"start_sec=0.00 "
-                                                f"duration={clip_duration:.2f}s",
-                                            )
-                                            rc = launch_uploader_clip(
-                                                uploader_python=str(args.uploader_python),
-                                                uploader_script=str(args.uploader_script),
-                                                source_video=str(args.video),
-                                                room_id=str(args.room_id),
-                                                cv_api_key=str(args.cv_api_key),
-                                                next_api_base_url=str(args.next_api_base_url),
-                                                start_offset_seconds=0.0,
-                                                duration_seconds=clip_duration,
-                                            )
-                                            uploads_started += 1
-                                            next_upload_left_threshold += 2
-                                            active_uploads.append({"trigger": uploads_started, "proc": rc})
-                                            print(
-                                                f"[uploader] started trigger={uploads_started} "
-                                                f"pid={rc.pid}"
-                                            )
-                                    except (requests.RequestException, ValueError, RuntimeError, OSError) as err:
-                                        print(f"[room-risk] failed room_id={args.room_id}: {err}")
-                                elif direction is not None:
-                                    left += 1
-                                last_side_by_id[tid_i] = curr_side
-                            elif curr_side != 0:
-                                last_side_by_id[tid_i] = curr_side
-
-                cv2.rectangle(
-                    frame,
-                    (int(x1), int(y1)),
-                    (int(x2), int(y2)),
-                    (0, 255, 0),
-                    2,
-                )
-                label = f"ID {tid}" if tid is not None else "person"
-                cv2.putText(
-                    frame,
-                    label,
-                    (int(x1), max(20, int(y1) - 8)),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.6,
-                    (0, 255, 0),
-                    2,
-                )
-
-        occupancy = max(0, int(args.initial_occupancy) + left - entered)
-        cv2.putText(
-            frame,
-            f"Mode={args.count_mode}  Occ={occupancy} (+{left}/-{entered})  People in frame: {people_in_frame}",
-            (20, 40),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.9,
-            (0, 255, 255),
-            2,
-        )
-
-        if args.show:
-            show_frame = frame
-            if display_scale != 1.0:
-                h, w = frame.shape[:2]
-                new_w = max(1, int(w * display_scale))
-                new_h = max(1, int(h * display_scale))
-                interp = cv2.INTER_AREA if display_scale < 1.0 else cv2.INTER_LINEAR
-                show_frame = cv2.resize(frame, (new_w, new_h), interpolation=interp)
-            cv2.imshow("People Detector", show_frame)
-            if cv2.waitKey(1) & 0xFF == ord("q"):
-                break
+                            left += 1
+
+                if draw and len(xyxy):
+                    # All boxes as closed 4-point contours in one polylines call.
+                    boxes = xyxy.astype(np.int32)
+                    corners = np.stack(
+                        (boxes[:, [0, 1]], boxes[:, [2, 1]], boxes[:, [2, 3]], boxes[:, [0, 3]]),
+                        axis=1,
+                    )
+                    cv2.polylines(frame, list(corners), True, (0, 255, 0), 2)
+                    labels = ["person"] * len(boxes) if ids is None else list(map(track_label, ids.tolist()))
+                    label_y = np.maximum(20, boxes[:, 1] - 8)
+                    for label, lx, ly in zip(labels, boxes[:, 0].tolist(), label_y.tolist()):
+                        blit_text(frame, label, (lx, ly), 0.6, (0, 255, 0), 2)
+
+            if draw:
+                # The HUD only changes with the counts, so it is re-rasterized only
+                # when one of them does. It keeps its own single sprite rather than
+                # sharing (and pinning entries in) the label cache.
+                hud_key = (left, entered, people_in_frame)
+                if hud_key != last_hud_key:
+                    last_hud_key = hud_key
+                    occupancy = max(0, initial_occupancy + left - entered)
+                    hud_text = (
+                        f"Mode={args.count_mode}  Occ={occupancy} (+{left}/-{entered})  "
+                        f"People in frame: {people_in_frame}"
+                    )
+                    hud_sprite = rasterize_text(hud_text, 0.9, 2)
+                blit_sprite(frame, hud_sprite, (20, 40), (0, 255, 255))
+
+            if display is not None:
+                if show_now:
+                    display.show(frame)
+                if display.quit_requested:
+                    stop = True
+                    break
 
-        if writer is not None:
-            writer.write(frame)
+            if writer is not None:
+                writer.write(frame)
 
-        if active_uploads:
-            reap_finished_uploads(active_uploads)
+            if pending_risk:
+                handle_risk_results()
 
-        frame_index += 1
+            # Uploads run for seconds; polling them a few times a second is plenty.
+            if active_uploads and time.monotonic() >= next_reap_at:
+                reap_finished_uploads(active_uploads)
+                next_reap_at = time.monotonic() + UPLOAD_REAP_INTERVAL_S
 
-        if stride > 1:
-            for _ in range(stride - 1):
-                if not cap.grab():
-                    break
-                frame_index += 1
+        if stop:
+            break
 
     cap.release()
+    handle_risk_results(block=True)
+    risk_pool.shutdown()
     session.close()
     if writer is not None:
         writer.release()
-    cv2.destroyAllWindows()
+    if display is not None:
+        display.close()
 
     reap_finished_uploads(active_uploads)
     if active_uploads: